@@ -4,7 +4,7 @@ import useWebSocket, { ReadyState } from 'react-use-websocket';
 import { ConfigurationScreen } from './components/ConfigurationScreen';
 import { ChatInterface } from './components/ChatInterface';
 import { Spinner } from './components/common/Spinner';
-import type { ConfigData, ChatMessage, FileNode, ServerToClientMessage, ClientToServerMessage } from './types';
+import type { ConfigData, ChatMessage, FileNode, ServerToClientFrame, ClientToServerMessage } from './types';
 import { WEBSOCKET_URL, MOCK_FILE_TREE_ENABLED, MOCK_FILE_TREE_DATA } from './constants';
 
 const App: React.FC = () => {
@@ -35,49 +35,53 @@ const App: React.FC = () => {
 
   useEffect(() => {
     if (lastJsonMessage) {
-      const message = lastJsonMessage as ServerToClientMessage;
-
-      // Clear mock file tree timeout if a relevant response arrives
-      if (message.type === 'FILE_TREE_DATA' || message.type === 'FILE_TREE_ERROR') {
-        if (mockFileTreeTimeoutRef.current !== null) {
-          clearTimeout(mockFileTreeTimeoutRef.current);
-          mockFileTreeTimeoutRef.current = null;
+      // Messages that are ready at the same time arrive batched in one array frame
+      const frame = lastJsonMessage as ServerToClientFrame;
+      const messages = Array.isArray(frame) ? frame : [frame];
+
+      for (const message of messages) {
+        // Clear mock file tree timeout if a relevant response arrives
+        if (message.type === 'FILE_TREE_DATA' || message.type === 'FILE_TREE_ERROR') {
+          if (mockFileTreeTimeoutRef.current !== null) {
+            clearTimeout(mockFileTreeTimeoutRef.current);
+            mockFileTreeTimeoutRef.current = null;
+          }
         }
-      }
 
-      switch (message.type) {
-        case 'CONFIG_SUCCESS':
-          setIsConfigured(true);
-          setSystemMessage('Configuration successful. You can now chat with the agent.');
-          setChatMessages(prev => prev.filter(msg => msg.sender === 'system'));
-          break;
-        case 'CONFIG_ERROR':
-          setSystemMessage(`Configuration Error: ${message.payload.message}`);
-          setIsConfigured(false);
-          break;
-        case 'FILE_TREE_DATA':
-          setFileTree(message.payload.tree);
-          setIsFileTreeLoading(false);
-          setFileTreeError(null);
-          break;
-        case 'FILE_TREE_ERROR':
-          setFileTreeError(message.payload.message);
-          setIsFileTreeLoading(false);
-          setFileTree(null);
-           if (MOCK_FILE_TREE_ENABLED) {
-            setSystemMessage(`File tree fetch error: ${message.payload.message}. Displaying mock data.`);
-            setFileTree(MOCK_FILE_TREE_DATA);
-            setFileTreeError(null); 
-          }
-          break;
-        case 'NEW_CHAT_MESSAGE':
-          setChatMessages((prevMessages) => [...prevMessages, message.payload]);
-          break;
-        case 'AGENT_TYPING':
-          console.log('Agent typing status:', message.payload.isTyping);
-          break;
-        default:
-          console.warn('Received unknown WebSocket message:', message);
+        switch (message.type) {
+          case 'CONFIG_SUCCESS':
+            setIsConfigured(true);
+            setSystemMessage('Configuration successful. You can now chat with the agent.');
+            setChatMessages(prev => prev.filter(msg => msg.sender === 'system'));
+            break;
+          case 'CONFIG_ERROR':
+            setSystemMessage(`Configuration Error: ${message.payload.message}`);
+            setIsConfigured(false);
+            break;
+          case 'FILE_TREE_DATA':
+            setFileTree(message.payload.tree);
+            setIsFileTreeLoading(false);
+            setFileTreeError(null);
+            break;
+          case 'FILE_TREE_ERROR':
+            setFileTreeError(message.payload.message);
+            setIsFileTreeLoading(false);
+            setFileTree(null);
+             if (MOCK_FILE_TREE_ENABLED) {
+              setSystemMessage(`File tree fetch error: ${message.payload.message}. Displaying mock data.`);
+              setFileTree(MOCK_FILE_TREE_DATA);
+              setFileTreeError(null); 
+            }
+            break;
+          case 'NEW_CHAT_MESSAGE':
+            setChatMessages((prevMessages) => [...prevMessages, message.payload]);
+            break;
+          case 'AGENT_TYPING':
+            console.log('Agent typing status:', message.payload.isTyping);
+            break;
+          default:
+            console.warn('Received unknown WebSocket message:', message);
+        }
       }
     }
   }, [lastJsonMessage]);
@@ -2,6 +2,7 @@
 AI agent service that handles chat interactions.
 """
 import asyncio
+import functools
 import logging
 from typing import Dict, Any, List
 from pydantic_ai import Agent, RunContext
@@ -9,6 +10,42 @@ from .github_service import GitHubService
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = (
+    "You are a code analysis and generation agent. "
+    "You can analyze code, create new code, and modify existing code. "
+    "You have access to various tools for interacting with GitHub repositories, "
+    "including fetching file trees, getting issues, creating pull requests, and more. "
+    "Plan your actions carefully to achieve the user's goals."
+)
+
+# GitHubService functions exposed to the agent as (function, name, description)
+_TOOLS = (
+    (GitHubService.get_issues, "get_issues", "Get issues from a GitHub repository"),
+    (GitHubService.create_issue, "create_issue", "Create a new issue in a GitHub repository"),
+    (GitHubService.create_branch, "create_branch", "Create a new branch in a GitHub repository"),
+    (GitHubService.push_file, "push_file", "Push a single file to a GitHub repository"),
+    (GitHubService.push_files, "push_files", "Push multiple files to a GitHub repository in a single commit"),
+    (GitHubService.create_pull_request, "create_pull_request", "Create a pull request in a GitHub repository"),
+    (GitHubService.get_pull_requests, "get_pull_requests", "Get pull requests from a GitHub repository"),
+    (GitHubService.get_file_content, "get_file_content", "Get the contents of a file from GitHub"),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_agent() -> Agent:
+    """Build the agent with the GitHub tools registered, once per process
+
+    The agent doesn't depend on the API key, so every configured client
+    shares it instead of re-deriving every tool schema.
+    """
+    agent = Agent(
+        model_name="google-gla:gemini-1.5-flash",
+        system_prompt=SYSTEM_PROMPT,
+    )
+    for fn, name, description in _TOOLS:
+        agent.add_tool(fn, name=name, description=description)
+    return agent
+
 
 class AIAgentService:
     """Service for interacting with AI models"""
@@ -20,59 +57,7 @@ class AIAgentService:
     def configure(self, api_key: str):
         """Configure the AI agent with an API key"""
         self.api_key = api_key
-        self.agent = Agent(
-            model_name="google-gla:gemini-1.5-flash",
-            system_prompt=(
-                "You are a code analysis and generation agent. "
-                "You can analyze code, create new code, and modify existing code. "
-                "You have access to various tools for interacting with GitHub repositories, "
-                "including fetching file trees, getting issues, creating pull requests, and more. "
-                "Plan your actions carefully to achieve the user's goals."
-            ),
-        )
-
-        # Add GitHubService functions as tools
-        self.agent.add_tool(
-            GitHubService.get_issues,
-            name="get_issues",
-            description="Get issues from a GitHub repository"
-        )
-        self.agent.add_tool(
-            GitHubService.create_issue,
-            name="create_issue",
-            description="Create a new issue in a GitHub repository"
-        )
-        self.agent.add_tool(
-            GitHubService.create_branch,
-            name="create_branch",
-            description="Create a new branch in a GitHub repository"
-        )
-        self.agent.add_tool(
-            GitHubService.push_file,
-            name="push_file",
-            description="Push a single file to a GitHub repository"
-        )
-        self.agent.add_tool(
-            GitHubService.push_files,
-            name="push_files",
-            description="Push multiple files to a GitHub repository in a single commit"
-        )
-        self.agent.add_tool(
-            GitHubService.create_pull_request,
-            name="create_pull_request",
-            description="Create a pull request in a GitHub repository"
-        )
-        self.agent.add_tool(
-            GitHubService.get_pull_requests,
-            name="get_pull_requests",
-            description="Get pull requests from a GitHub repository"
-        )
-        self.agent.add_tool(
-            GitHubService.get_file_content,
-            name="get_file_content",
-            description="Get the contents of a file from GitHub"
-        )
-
+        self.agent = _get_agent()
         logger.info("AI agent configured with GitHub tools")
     
     async def process_message(self, message: str, context: Dict[str, Any]) -> str:
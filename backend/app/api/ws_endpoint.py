@@ -1,14 +1,22 @@
 """
 WebSocket API endpoints
 """
-import json
 import logging
+from typing import Dict
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from ..core.ws_manager import manager
+from ..core.ws_manager import ConnectionManager, Handler, manager
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Message type -> handler, built once at import time
+HANDLERS: Dict[str, Handler] = {
+    "SUBMIT_CONFIG": ConnectionManager.handle_submit_config,
+    "FETCH_FILES": ConnectionManager.handle_fetch_files,
+    "SEND_CHAT_MESSAGE": ConnectionManager.handle_chat_message,
+}
+
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -24,29 +32,28 @@ async def websocket_endpoint(websocket: WebSocket):
             
             # Parse the message
             try:
-                message = json.loads(data)
+                message = orjson.loads(data)
                 message_type = message.get("type", "").upper()
                 payload = message.get("payload", {})
                 
-                # Handle different message types
-                if message_type == "SUBMIT_CONFIG":
-                    await manager.handle_submit_config(client_id, payload)
-                elif message_type == "FETCH_FILES":
-                    await manager.handle_fetch_files(client_id, payload)
-                elif message_type == "SEND_CHAT_MESSAGE":
-                    await manager.handle_chat_message(client_id, payload)
+                # Dispatch to the handler for this message type
+                handler = HANDLERS.get(message_type)
+                if handler is not None:
+                    await handler(manager, client_id, payload)
                 else:
-                    logger.warning(f"Unknown message type: {message_type}")
+                    logger.warning("Unknown message type: %s", message_type)
                     
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received: {data}")
+            except orjson.JSONDecodeError:
+                logger.error("Invalid JSON received: %s", data)
             except Exception as e:
-                logger.error(f"Error processing message: {e}")
+                logger.error("Error processing message: %s", e)
     
     except WebSocketDisconnect:
         # Handle client disconnect
-        manager.disconnect(client_id)
+        pass
     except Exception as e:
         # Handle any other exceptions
-        logger.error(f"WebSocket error: {e}")
-        manager.disconnect(client_id)
+        logger.error("WebSocket error: %s", e)
+    finally:
+        # Always release per-client state, even when the task is cancelled
+        await manager.disconnect(client_id)
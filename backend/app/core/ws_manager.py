@@ -1,136 +1,360 @@
 """
 WebSocket connection manager
 """
-import json
+import functools
+import hashlib
 import logging
 import uuid
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Any, Optional, Tuple, Type, Union
 import asyncio
+import orjson
 from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import TypeAdapter
 from ..models.models import db
-from ..schemas.ws_schemas import ChatMessage, MessageSender, FileNode
+from ..schemas.ws_schemas import (
+    AgentTypingMessage, ChatMessage, ConfigErrorMessage, ConfigSuccessMessage, FileNode,
+    FileTreeDataMessage, FileTreeErrorMessage, MessageSender, NewChatMessage, ServerMessage,
+)
 from ..services.github_service import GitHubService
 from ..services.ai_service import AIAgentService
 
 logger = logging.getLogger(__name__)
 
+# Soft cap on the size of a single batched outbound frame
+MAX_BATCH_BYTES = 64 * 1024
+
+# Queued frames after which a client that isn't reading is disconnected
+MAX_PENDING_FRAMES = 1024
+
+# Close code sent to clients that fall too far behind ("Try Again Later")
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+# Seconds to wait for a lagging client's close handshake
+WS_CLOSE_TIMEOUT = 5.0
+
+# Total bytes of encoded file trees kept in memory
+TREE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Encoded file trees larger than this are sent without being cached
+MAX_CACHED_TREE_BYTES = 8 * 1024 * 1024
+
+# Seconds to wait for more chat messages before answering a burst
+CHAT_COALESCE_DELAY = 0.05
+
+# Maximum number of AI calls in flight across all clients
+AI_CONCURRENCY = 32
+
+# Serializes FileNode trees straight to JSON bytes in pydantic-core
+_FILE_TREE_ADAPTER = TypeAdapter(List[FileNode])
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    """Encode an outbound message to JSON bytes"""
+    return orjson.dumps(message)
+
+
+def encode_error(message_class: Type[ServerMessage], message: str) -> bytes:
+    """Encode an error message without building the envelope dict"""
+    return message_class.dump_bytes(b'{"message":' + orjson.dumps(message) + b"}")
+
+
+def encode_file_tree(file_tree: List[FileNode]) -> bytes:
+    """Encode a FILE_TREE_DATA message without building intermediate dicts"""
+    return FileTreeDataMessage.dump_bytes(b'{"tree":' + _FILE_TREE_ADAPTER.dump_json(file_tree) + b"}")
+
+
+# Pre-encoded frames for static server -> client messages
+_CONFIG_SUCCESS = ConfigSuccessMessage().model_dump_json().encode()
+_TYPING_ON = AgentTypingMessage.dump_bytes(b'{"isTyping":true}')
+_TYPING_OFF = AgentTypingMessage.dump_bytes(b'{"isTyping":false}')
+_MISSING_REPO_OR_TOKEN = encode_error(FileTreeErrorMessage, "Repository and GitHub token are required")
+
+
+Handler = Callable[["ConnectionManager", str, Dict[str, Any]], Awaitable[None]]
+
+
+def reports_errors(error_class: Type[ServerMessage]) -> Callable[[Handler], Handler]:
+    """Decorate a message handler to log failures and report them to the client"""
+    def decorator(handler: Handler) -> Handler:
+        @functools.wraps(handler)
+        async def wrapper(self: "ConnectionManager", client_id: str, payload: Dict[str, Any]) -> None:
+            try:
+                await handler(self, client_id, payload)
+            except Exception as e:
+                logger.error("Error in %s: %s", handler.__name__, e)
+                await self.send_frame(encode_error(error_class, str(e)), client_id)
+        return wrapper
+    return decorator
+
+
+class Connection:
+    """Per-client state for a connected WebSocket"""
+    __slots__ = ("websocket", "config", "outbound", "wakeup", "chat_queue", "writer", "chat_worker", "closing")
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        # Latest submitted configuration, mirrored from the database
+        self.config: Dict[str, Any] = {}
+        self.outbound: Deque[bytes] = deque()
+        # Set while the writer is idle; resolved to wake it up
+        self.wakeup: Optional[asyncio.Future] = None
+        self.chat_queue: asyncio.Queue = asyncio.Queue()
+        self.writer: Optional[asyncio.Task] = None
+        self.chat_worker: Optional[asyncio.Task] = None
+        self.closing = False
+    
+    def enqueue(self, frame: bytes) -> None:
+        """Queue an encoded message and wake the writer if it is idle
+        
+        A client that lets MAX_PENDING_FRAMES pile up is disconnected rather
+        than buffering without bound.
+        """
+        if self.closing:
+            return
+        if len(self.outbound) >= MAX_PENDING_FRAMES:
+            self._close_lagging()
+            return
+        self.outbound.append(frame)
+        wakeup = self.wakeup
+        if wakeup is not None and not wakeup.done():
+            wakeup.set_result(None)
+    
+    def _close_lagging(self) -> None:
+        """Drop a lagging client's queue and close its socket"""
+        self.closing = True
+        logger.warning("Closing WebSocket with %d unsent messages", len(self.outbound))
+        self.outbound.clear()
+        if self.writer is not None:
+            self.writer.cancel()
+        # Replaces the writer so disconnect() waits for the close to finish
+        self.writer = asyncio.ensure_future(self._close(WS_CLOSE_TRY_AGAIN_LATER))
+    
+    async def _close(self, code: int) -> None:
+        """Close the socket, ignoring clients that are already gone"""
+        try:
+            # A client that stopped reading may never take the close frame
+            await asyncio.wait_for(self.websocket.close(code=code), WS_CLOSE_TIMEOUT)
+        except Exception as e:
+            logger.error("Error closing WebSocket: %s", e)
+
 
 class ConnectionManager:
     """WebSocket connection manager"""
     
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.active_connections: Dict[str, Connection] = {}
         self.ai_service = AIAgentService()
+        # Encoded FILE_TREE_DATA frames keyed by (repo, commit sha)
+        self._tree_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._tree_cache_bytes = 0
+        self._ai_semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+        # Pending AI calls keyed by a digest of (prompt, config)
+        self._inflight_responses: Dict[bytes, asyncio.Task] = {}
     
     async def connect(self, websocket: WebSocket) -> str:
         """Connect a new WebSocket client"""
         await websocket.accept()
         client_id = str(uuid.uuid4())
-        self.active_connections[client_id] = websocket
+        conn = Connection(websocket)
+        self.active_connections[client_id] = conn
+        conn.writer = asyncio.create_task(self._writer_loop(conn))
+        conn.chat_worker = asyncio.create_task(self._chat_loop(client_id, conn.chat_queue))
         db.add_connection(client_id)
-        logger.info(f"Client connected: {client_id}")
+        logger.info("Client connected: %s", client_id)
         return client_id
     
-    def disconnect(self, client_id: str) -> None:
+    async def disconnect(self, client_id: str) -> None:
         """Disconnect a WebSocket client"""
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+        conn = self.active_connections.pop(client_id, None)
+        if conn is not None:
+            # Wait for the client's tasks to finish instead of leaving them dangling
+            tasks = [task for task in (conn.writer, conn.chat_worker) if task is not None]
+            for task in tasks:
+                # A lagging client's writer is its close handshake; let it finish
+                if not (conn.closing and task is conn.writer):
+                    task.cancel()
+            await asyncio.wait(tasks)
         db.remove_connection(client_id)
-        logger.info(f"Client disconnected: {client_id}")
+        logger.info("Client disconnected: %s", client_id)
     
     async def send_personal_message(self, message: Dict[str, Any], client_id: str) -> None:
-        """Send a message to a specific client"""
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(message)
+        """Queue a message for a specific client"""
+        await self.send_frame(encode_message(message), client_id)
     
-    async def handle_submit_config(self, client_id: str, payload: Dict[str, Any]) -> None:
-        """Handle configuration submission"""
+    async def send_frame(self, frame: bytes, client_id: str) -> None:
+        """Queue an already-encoded message for a specific client"""
+        conn = self.active_connections.get(client_id)
+        if conn is not None:
+            conn.enqueue(frame)
+    
+    async def send_batch(self, messages: List[Union[Dict[str, Any], bytes]], client_id: str) -> None:
+        """Queue a group of messages for a client to be delivered in one frame
+        
+        Messages may be dicts or already-encoded frames. They are queued
+        without yielding to the event loop, so the writer always finds them
+        together (up to MAX_BATCH_BYTES).
+        """
+        conn = self.active_connections.get(client_id)
+        if conn is not None:
+            for message in messages:
+                if not isinstance(message, bytes):
+                    message = encode_message(message)
+                conn.enqueue(message)
+    
+    async def _writer_loop(self, conn: Connection) -> None:
+        """Drain a client's outbound queue, coalescing ready messages into one frame
+        
+        Messages that are already queued when the writer wakes up are sent
+        together as a JSON array, so a handler emitting several messages in a
+        row costs a single WebSocket frame.
+        """
+        websocket = conn.websocket
+        outbound = conn.outbound
+        loop = asyncio.get_running_loop()
         try:
-            # Store configuration in the database
-            db.update_connection_config(client_id, payload)
-            
-            # Configure AI service with the provided API key
-            self.ai_service.configure(payload.get("geminiToken", ""))
-            
-            # Send success response
-            await self.send_personal_message({"type": "CONFIG_SUCCESS"}, client_id)
-            
+            while True:
+                if not outbound:
+                    conn.wakeup = loop.create_future()
+                    await conn.wakeup
+                    conn.wakeup = None
+                
+                batch = [outbound.popleft()]
+                size = len(batch[0])
+                while outbound and size < MAX_BATCH_BYTES:
+                    frame = outbound.popleft()
+                    batch.append(frame)
+                    size += len(frame)
+                
+                # Clients consume text frames, so decode once per frame
+                if len(batch) == 1:
+                    await websocket.send_text(batch[0].decode())
+                else:
+                    await websocket.send_text((b"[" + b",".join(batch) + b"]").decode())
         except Exception as e:
-            logger.error(f"Error in handle_submit_config: {e}")
-            await self.send_personal_message({
-                "type": "CONFIG_ERROR",
-                "payload": {"message": str(e)}
-            }, client_id)
+            logger.error("Error writing to WebSocket: %s", e)
+    
+    @reports_errors(ConfigErrorMessage)
+    async def handle_submit_config(self, client_id: str, payload: Dict[str, Any]) -> None:
+        """Handle configuration submission"""
+        # Store configuration in the database and on the connection
+        db.update_connection_config(client_id, payload)
+        conn = self.active_connections.get(client_id)
+        if conn is not None:
+            conn.config = payload
+        
+        # Configure AI service with the provided API key
+        self.ai_service.configure(payload.get("geminiToken", ""))
+        
+        # Send success response
+        await self.send_frame(_CONFIG_SUCCESS, client_id)
     
+    @reports_errors(FileTreeErrorMessage)
     async def handle_fetch_files(self, client_id: str, payload: Dict[str, Any]) -> None:
         """Handle file tree fetching"""
-        try:
-            # Set typing indicator
-            await self.send_personal_message({
-                "type": "AGENT_TYPING",
-                "payload": {"isTyping": True}
-            }, client_id)
-            
-            # Fetch file tree from GitHub
-            repo = payload.get("repo", "")
-            branch = payload.get("branch", "main")
-            token = payload.get("githubToken", "")
-            
-            # Check if required parameters are provided
-            if not repo or not token:
-                await self.send_personal_message({
-                    "type": "FILE_TREE_ERROR",
-                    "payload": {"message": "Repository and GitHub token are required"}
-                }, client_id)
-                return
-                
-            # Fetch the file tree
-            file_tree = await GitHubService.fetch_file_tree(repo, branch, token)
-            
-            # Send the file tree to the client
-            await self.send_personal_message({
-                "type": "FILE_TREE_DATA",
-                "payload": {"tree": [node.model_dump() for node in file_tree]}
-            }, client_id)
-            
-            # Turn off typing indicator
-            await self.send_personal_message({
-                "type": "AGENT_TYPING",
-                "payload": {"isTyping": False}
-            }, client_id)
+        # Set typing indicator
+        await self.send_frame(_TYPING_ON, client_id)
+        
+        # Fetch file tree from GitHub
+        repo = payload.get("repo", "")
+        branch = payload.get("branch", "main")
+        token = payload.get("githubToken", "")
+        
+        # Check if required parameters are provided
+        if not repo or not token:
+            await self.send_frame(_MISSING_REPO_OR_TOKEN, client_id)
+            return
             
-        except Exception as e:
-            logger.error(f"Error in handle_fetch_files: {e}")
-            await self.send_personal_message({
-                "type": "FILE_TREE_ERROR",
-                "payload": {"message": str(e)}
-            }, client_id)
+        # Resolve the ref (branch, tag or SHA) so an unchanged tree is served from cache
+        sha = await GitHubService.get_commit_sha(repo, branch, token)
+        cache_key = (repo, sha)
+        tree_frame = self._tree_cache.get(cache_key)
+        
+        if tree_frame is None:
+            # Fetch the file tree at the resolved commit
+            file_tree = await GitHubService.fetch_file_tree(repo, sha, token)
+            # Large trees take a while to encode, so keep it off the event loop
+            tree_frame = await asyncio.to_thread(encode_file_tree, file_tree)
+            self._cache_tree(cache_key, tree_frame)
+        else:
+            self._tree_cache.move_to_end(cache_key)
+        
+        # Send the file tree and turn off the typing indicator
+        await self.send_batch([
+            tree_frame,
+            _TYPING_OFF,
+        ], client_id)
+    
+    def _cache_tree(self, key: Tuple[str, str], frame: bytes) -> None:
+        """Cache an encoded file tree, evicting the oldest past TREE_CACHE_BYTES"""
+        if len(frame) > MAX_CACHED_TREE_BYTES:
+            return
+        # Concurrent misses for the same commit both land here
+        previous = self._tree_cache.pop(key, None)
+        if previous is not None:
+            self._tree_cache_bytes -= len(previous)
+        self._tree_cache[key] = frame
+        self._tree_cache_bytes += len(frame)
+        while self._tree_cache_bytes > TREE_CACHE_BYTES and self._tree_cache:
+            _, evicted = self._tree_cache.popitem(last=False)
+            self._tree_cache_bytes -= len(evicted)
     
     async def handle_chat_message(self, client_id: str, payload: Dict[str, Any]) -> None:
-        """Handle incoming chat messages"""
+        """Handle incoming chat messages
+        
+        The message is stored and queued for the client's chat worker, which
+        answers bursts of messages with a single AI call.
+        """
         try:
             text = payload.get("text", "")
             if not text:
                 return
+            if not isinstance(text, str):
+                raise TypeError("Chat message text must be a string")
                 
             # Save user message (don't send back to client - frontend already displays it)
-            user_msg = db.add_message(
+            db.add_message(
                 client_id=client_id,
                 sender=MessageSender.USER,
                 text=text
             )
             
+            conn = self.active_connections.get(client_id)
+            if conn is not None:
+                conn.chat_queue.put_nowait(text)
+            
+        except Exception as e:
+            logger.error("Error in handle_chat_message: %s", e)
+            await self._send_chat_error(client_id, e)
+    
+    async def _chat_loop(self, client_id: str, queue: asyncio.Queue) -> None:
+        """Answer a client's queued chat messages, merging bursts into one prompt"""
+        while True:
+            texts = [await queue.get()]
+            
+            # Give the rest of a burst a moment to arrive
+            await asyncio.sleep(CHAT_COALESCE_DELAY)
+            while not queue.empty():
+                texts.append(queue.get_nowait())
+            
+            try:
+                await self._respond_to_chat(client_id, "\n".join(texts))
+            except Exception as e:
+                # Keep answering later messages if one batch fails
+                logger.error("Error in chat worker: %s", e)
+    
+    async def _respond_to_chat(self, client_id: str, text: str) -> None:
+        """Generate and send the agent's response to a chat prompt"""
+        try:
             # Set typing indicator on
-            await self.send_personal_message({
-                "type": "AGENT_TYPING",
-                "payload": {"isTyping": True}
-            }, client_id)
+            await self.send_frame(_TYPING_ON, client_id)
             
             # Get user context
-            config = db.get_connection_config(client_id) or {}
+            conn = self.active_connections.get(client_id)
+            config = conn.config if conn is not None else {}
             
             # Process the message with AI service
-            response = await self.ai_service.process_message(text, config)
+            response = await self._generate_response(text, config)
             
             # Save agent response
             agent_msg = db.add_message(
@@ -139,36 +363,52 @@ class ConnectionManager:
                 text=response
             )
             
-            # Turn off typing indicator
-            await self.send_personal_message({
-                "type": "AGENT_TYPING",
-                "payload": {"isTyping": False}
-            }, client_id)
-            
-            # Send agent response
-            await self.send_personal_message({
-                "type": "NEW_CHAT_MESSAGE",
-                "payload": agent_msg
-            }, client_id)
+            # Turn off typing indicator and send agent response
+            await self.send_batch([
+                _TYPING_OFF,
+                NewChatMessage.dump_bytes(encode_message(agent_msg)),
+            ], client_id)
             
         except Exception as e:
-            logger.error(f"Error in handle_chat_message: {e}")
-            # Send error message
-            error_msg = db.add_message(
-                client_id=client_id,
-                sender=MessageSender.SYSTEM,
-                text=f"Error processing message: {str(e)}"
-            )
-            await self.send_personal_message({
-                "type": "NEW_CHAT_MESSAGE",
-                "payload": error_msg
-            }, client_id)
-            
-            # Turn off typing indicator
-            await self.send_personal_message({
-                "type": "AGENT_TYPING",
-                "payload": {"isTyping": False}
-            }, client_id)
+            logger.error("Error in handle_chat_message: %s", e)
+            await self._send_chat_error(client_id, e)
+    
+    async def _send_chat_error(self, client_id: str, error: Exception) -> None:
+        """Store a chat failure as a SYSTEM message and send it to the client"""
+        error_msg = db.add_message(
+            client_id=client_id,
+            sender=MessageSender.SYSTEM,
+            text=f"Error processing message: {str(error)}"
+        )
+        # Send the error and turn off typing indicator
+        await self.send_batch([
+            NewChatMessage.dump_bytes(encode_message(error_msg)),
+            _TYPING_OFF,
+        ], client_id)
+    
+    async def _generate_response(self, text: str, config: Dict[str, Any]) -> str:
+        """Ask the AI service for a response, sharing identical in-flight calls
+        
+        Calls are limited to AI_CONCURRENCY at a time. A prompt that is already
+        being answered with the same configuration waits for that call instead
+        of starting another one.
+        """
+        key = hashlib.blake2b(
+            text.encode() + b"\0" + orjson.dumps(config, option=orjson.OPT_SORT_KEYS),
+            digest_size=16,
+        ).digest()
+        task = self._inflight_responses.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_ai_service(text, config))
+            self._inflight_responses[key] = task
+            task.add_done_callback(lambda _: self._inflight_responses.pop(key, None))
+        # Shielded so one client disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(task)
+    
+    async def _call_ai_service(self, text: str, config: Dict[str, Any]) -> str:
+        """Call the AI service once a concurrency slot is free"""
+        async with self._ai_semaphore:
+            return await self.ai_service.process_message(text, config)
 
 
 # Create a single connection manager instance
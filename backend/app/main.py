@@ -2,7 +2,10 @@
 Main FastAPI application
 """
 import os
+import sys
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -19,11 +22,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown"""
+    if sys.version_info >= (3, 12):
+        # Run new tasks eagerly until their first real suspension
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    yield
+
+
 # Create FastAPI application
 app = FastAPI(
     title="AI Chat Stack Backend",
     description="Backend for React WebSocket Chat Application",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
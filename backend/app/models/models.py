@@ -2,8 +2,8 @@
 Database models (in-memory for this example)
 """
 from typing import List, Dict, Any, Optional
+import time
 import uuid
-from datetime import datetime
 
 
 class InMemoryConnection:
@@ -27,27 +27,28 @@ class InMemoryDatabase:
 
     def remove_connection(self, client_id: str) -> None:
         """Remove a WebSocket connection"""
-        if client_id in self.connections:
-            del self.connections[client_id]
+        self.connections.pop(client_id, None)
 
     def update_connection_config(self, client_id: str, config: Dict[str, Any]) -> None:
         """Update configuration for a connection"""
-        if client_id in self.connections:
-            self.connections[client_id].config = config
+        connection = self.connections.get(client_id)
+        if connection is not None:
+            connection.config = config
     
     def get_connection_config(self, client_id: str) -> Optional[Dict[str, Any]]:
         """Get configuration for a connection"""
-        if client_id in self.connections:
-            return self.connections[client_id].config
+        connection = self.connections.get(client_id)
+        if connection is not None:
+            return connection.config
         return None
 
     def add_message(self, client_id: str, sender: str, text: str) -> Dict[str, Any]:
         """Add a new message"""
         message = {
-            "id": str(uuid.uuid4()),
+            "id": uuid.uuid4().hex,
             "sender": sender,
             "text": text, 
-            "timestamp": int(datetime.now().timestamp() * 1000),
+            "timestamp": time.time_ns() // 1_000_000,
             "client_id": client_id
         }
         self.messages.append(message)
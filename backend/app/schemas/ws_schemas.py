@@ -2,8 +2,11 @@
 Pydantic schemas for the application
 """
 from enum import Enum
-from typing import List, Optional, Union, Dict, Any
-from pydantic import BaseModel, Field
+from typing import Any, ClassVar, Dict, List, Literal, Optional, Union
+import orjson
+from pydantic import BaseModel, ConfigDict, Field
+# pydantic needs typing_extensions' TypedDict before Python 3.12
+from typing_extensions import TypedDict
 
 
 class MessageSender(str, Enum):
@@ -63,37 +66,72 @@ class ClientMessage(BaseModel):
     payload: Union[ConfigData, FetchFilesPayload, SendChatMessagePayload, Dict[str, Any]]
 
 
+# Server -> Client Payload Types
+class ErrorPayload(TypedDict):
+    """Payload for error messages"""
+    message: str
+
+
+class FileTreePayload(TypedDict):
+    """Payload for file tree data"""
+    tree: List[FileNode]
+
+
+class AgentTypingPayload(TypedDict):
+    """Payload for agent typing status"""
+    isTyping: bool
+
+
 # Server -> Client Message Types
-class ConfigSuccessMessage(BaseModel):
+class ServerMessage(BaseModel):
+    """Base model for server messages"""
+    model_config = ConfigDict(frozen=True)
+    
+    # `{"type":"...","payload":` for the subclass, encoded once
+    envelope_prefix: ClassVar[bytes] = b""
+    
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        message_type = cls.model_fields["type"].default
+        cls.envelope_prefix = b'{"type":' + orjson.dumps(message_type) + b',"payload":'
+    
+    @classmethod
+    def dump_bytes(cls, payload: bytes) -> bytes:
+        """Wrap an already-encoded JSON payload in this message's envelope"""
+        return cls.envelope_prefix + payload + b"}"
+
+
+class ConfigSuccessMessage(ServerMessage):
     """Success message for configuration"""
-    type: str = "CONFIG_SUCCESS"
+    type: Literal["CONFIG_SUCCESS"] = "CONFIG_SUCCESS"
 
 
-class ConfigErrorMessage(BaseModel):
+class ConfigErrorMessage(ServerMessage):
     """Error message for configuration"""
-    type: str = "CONFIG_ERROR"
-    payload: Dict[str, str]
+    type: Literal["CONFIG_ERROR"] = "CONFIG_ERROR"
+    payload: ErrorPayload
 
 
-class FileTreeDataMessage(BaseModel):
+class FileTreeDataMessage(ServerMessage):
     """File tree data message"""
-    type: str = "FILE_TREE_DATA"
-    payload: Dict[str, List[FileNode]]
+    type: Literal["FILE_TREE_DATA"] = "FILE_TREE_DATA"
+    payload: FileTreePayload
 
 
-class FileTreeErrorMessage(BaseModel):
+class FileTreeErrorMessage(ServerMessage):
     """File tree error message"""
-    type: str = "FILE_TREE_ERROR"
-    payload: Dict[str, str]
+    type: Literal["FILE_TREE_ERROR"] = "FILE_TREE_ERROR"
+    payload: ErrorPayload
 
 
-class NewChatMessage(BaseModel):
+class NewChatMessage(ServerMessage):
     """New chat message"""
-    type: str = "NEW_CHAT_MESSAGE"
+    type: Literal["NEW_CHAT_MESSAGE"] = "NEW_CHAT_MESSAGE"
     payload: ChatMessage
 
 
-class AgentTypingMessage(BaseModel):
+class AgentTypingMessage(ServerMessage):
     """Agent typing status message"""
-    type: str = "AGENT_TYPING"
-    payload: Dict[str, bool]
+    type: Literal["AGENT_TYPING"] = "AGENT_TYPING"
+    payload: AgentTypingPayload
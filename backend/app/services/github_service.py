@@ -1,90 +1,281 @@
 """
 GitHub integration service
 """
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
+import json
 import logging
-from github import Github, GithubException
+import threading
+import time
+import urllib.parse
+from github import Auth, BadCredentialsException, Github, GithubException
+from github.Repository import Repository
 from ..schemas.ws_schemas import FileNode, FileNodeType
 
 logger = logging.getLogger(__name__)
 
+# Seconds a Repository handle is reused before it is fetched again
+REPO_HANDLE_TTL = 60.0
+
+# Number of Repository handles kept in memory
+REPO_HANDLE_CACHE_SIZE = 128
+
+# Seconds a resolved ref is trusted before asking GitHub again
+RESOLVED_REF_TTL = 15.0
+
+# Number of resolved refs kept in memory
+RESOLVED_REF_CACHE_SIZE = 256
+
+# Directory listings fetched at once when walking a truncated tree
+DIRECTORY_FETCH_WORKERS = 8
+
+# Number of GitHub clients (one HTTP session each) kept in memory
+GITHUB_CLIENT_CACHE_SIZE = 128
+
+# Connections each client's HTTP session keeps open to the API
+GITHUB_POOL_SIZE = 20
+
+# Caches below key on token_digest(token), so raw tokens aren't kept as keys
+_github_clients: "OrderedDict[str, Github]" = OrderedDict()
+_github_clients_lock = threading.Lock()
+
+# (fetched at, handle) keyed by (repo, token digest); shared by worker threads
+_repo_handles: "OrderedDict[Tuple[str, str], Tuple[float, Repository]]" = OrderedDict()
+_repo_handles_lock = threading.Lock()
+
+# (resolved at, ETag, commit sha) of the last ref lookup keyed by (repo, ref, token digest)
+_resolved_refs: "OrderedDict[Tuple[str, str, str], Tuple[float, Optional[str], str]]" = OrderedDict()
+_resolved_refs_lock = threading.Lock()
+
+
+def token_digest(token: str) -> str:
+    """Digest a token for use as a cache key"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
 
 class GitHubService:
     """Service for interacting with GitHub API"""
     
+    @staticmethod
+    async def get_commit_sha(repo_name: str, ref: str, token: str) -> str:
+        """Get the commit SHA a branch, tag or commit SHA points to
+        
+        A ref resolved within RESOLVED_REF_TTL by the same token is answered
+        from memory.
+        """
+        key = (repo_name, ref, token_digest(token))
+        with _resolved_refs_lock:
+            cached = _resolved_refs.get(key)
+        if cached is not None and time.monotonic() - cached[0] < RESOLVED_REF_TTL:
+            return cached[2]
+        
+        # PyGithub blocks on HTTP, so run it off the event loop
+        return await asyncio.to_thread(GitHubService._get_commit_sha, repo_name, ref, token)
+    
     @staticmethod
     async def fetch_file_tree(repo_name: str, branch: str, token: str) -> List[FileNode]:
-        """Fetch file tree from GitHub repository"""
+        """Fetch file tree from GitHub repository
+        
+        `branch` may be a branch name or a commit SHA.
+        """
+        return await asyncio.to_thread(GitHubService._fetch_file_tree, repo_name, branch, token)
+    
+    @staticmethod
+    def _get_client(token: str) -> Github:
+        """Get the GitHub client for a token, reusing its HTTP session"""
+        key = token_digest(token)
+        evicted = None
+        with _github_clients_lock:
+            client = _github_clients.get(key)
+            if client is None:
+                client = Github(auth=Auth.Token(token), pool_size=GITHUB_POOL_SIZE)
+                _github_clients[key] = client
+                if len(_github_clients) > GITHUB_CLIENT_CACHE_SIZE:
+                    _, evicted = _github_clients.popitem(last=False)
+            else:
+                _github_clients.move_to_end(key)
+        # Release the evicted client's pooled connections
+        if evicted is not None:
+            evicted.close()
+        return client
+    
+    @staticmethod
+    def _forget_token(token: str) -> None:
+        """Drop the cached client, handles and resolved refs for a rejected token"""
+        digest = token_digest(token)
+        with _github_clients_lock:
+            client = _github_clients.pop(digest, None)
+        if client is not None:
+            client.close()
+        with _repo_handles_lock:
+            for key in [key for key in _repo_handles if key[1] == digest]:
+                del _repo_handles[key]
+        with _resolved_refs_lock:
+            for key in [key for key in _resolved_refs if key[2] == digest]:
+                del _resolved_refs[key]
+    
+    @staticmethod
+    def _get_repo(repo_name: str, token: str) -> Repository:
+        """Get a Repository handle, reusing a recent one for the same token"""
+        key = (repo_name, token_digest(token))
+        now = time.monotonic()
+        with _repo_handles_lock:
+            cached = _repo_handles.get(key)
+            if cached is not None and now - cached[0] < REPO_HANDLE_TTL:
+                _repo_handles.move_to_end(key)
+                return cached[1]
+        
+        # Lazy handles skip the metadata GET; a missing repo fails on first use
+        repo = GitHubService._get_client(token).get_repo(repo_name, lazy=True)
+        with _repo_handles_lock:
+            _repo_handles[key] = (now, repo)
+            _repo_handles.move_to_end(key)
+            if len(_repo_handles) > REPO_HANDLE_CACHE_SIZE:
+                _repo_handles.popitem(last=False)
+        return repo
+    
+    @staticmethod
+    def _get_commit_sha(repo_name: str, ref: str, token: str) -> str:
+        """Resolve a branch, tag or commit SHA to a commit SHA (blocking)
+        
+        Asks for the sha media type so the response body is just the SHA.
+        Repeat lookups send the previous ETag, so an unchanged ref is
+        answered with a 304 that doesn't count against the rate limit.
+        """
         try:
-            # Create GitHub instance with token
-            g = Github(token)
+            repo = GitHubService._get_repo(repo_name, token)
+            key = (repo_name, ref, token_digest(token))
+            with _resolved_refs_lock:
+                cached = _resolved_refs.get(key)
             
-            # Get the repository
-            repo = g.get_repo(repo_name)
-            
-            # Get the top-level contents for the specified branch
-            contents = repo.get_contents("", ref=branch)
+            headers = {"Accept": "application/vnd.github.sha"}
+            if cached is not None and cached[1]:
+                headers["If-None-Match"] = cached[1]
+            status, response_headers, output = repo._requester.requestJson(
+                "GET", f"{repo.url}/commits/{urllib.parse.quote(ref)}", headers=headers
+            )
+            if status == 304 and cached is not None:
+                etag, sha = cached[1], cached[2]
+            elif status >= 400:
+                try:
+                    data = json.loads(output) if output else None
+                except ValueError:
+                    data = {"message": output}
+                raise repo._requester.createException(status, response_headers, data)
+            else:
+                etag, sha = response_headers.get("etag"), output.strip()
             
-            # Convert contents to FileNode objects
-            file_nodes: List[FileNode] = []
+            with _resolved_refs_lock:
+                _resolved_refs[key] = (time.monotonic(), etag, sha)
+                _resolved_refs.move_to_end(key)
+                if len(_resolved_refs) > RESOLVED_REF_CACHE_SIZE:
+                    _resolved_refs.popitem(last=False)
+            return sha
+        
+        except BadCredentialsException as e:
+            logger.error("GitHub rejected the token: %s", e)
+            GitHubService._forget_token(token)
+            raise e
+        except GithubException as e:
+            logger.error("GitHub error: %s", e)
+            raise e
+    
+    @staticmethod
+    def _fetch_file_tree(repo_name: str, branch: str, token: str) -> List[FileNode]:
+        """Fetch file tree from GitHub repository (blocking)"""
+        try:
+            # Get the repository
+            repo = GitHubService._get_repo(repo_name, token)
             
-            for content in contents:
-                if content.type == "dir":
-                    # It's a directory, recursively get its contents
-                    file_nodes.append(
-                        FileNode(
-                            id=content.path,
-                            name=content.name,
-                            type=FileNodeType.DIRECTORY,
-                            path=content.path,
-                            children=GitHubService._get_directory_contents(repo, content.path, branch)
-                        )
-                    )
-                else:
-                    # It's a file
-                    file_nodes.append(
-                        FileNode(
-                            id=content.path,
-                            name=content.name,
-                            type=FileNodeType.FILE,
-                            path=content.path
-                        )
-                    )
+            # Get the whole tree in one request
+            tree = repo.get_git_tree(branch, recursive=True)
+            if tree.raw_data.get("truncated"):
+                # Too large for a single response, walk it directory by directory
+                logger.info("Tree for %s@%s is truncated, fetching per directory", repo_name, branch)
+                return GitHubService._get_directory_contents(repo, "", branch)
             
-            return file_nodes
+            return GitHubService._build_file_nodes(tree.tree)
         
+        except BadCredentialsException as e:
+            logger.error("GitHub rejected the token: %s", e)
+            GitHubService._forget_token(token)
+            raise e
         except GithubException as e:
-            logger.error(f"GitHub error: {e}")
+            logger.error("GitHub error: %s", e)
             raise e
         except Exception as e:
-            logger.error(f"Error fetching GitHub file tree: {e}")
+            logger.error("Error fetching GitHub file tree: %s", e)
             raise e
     
     @staticmethod
-    def _get_directory_contents(repo: Any, path: str, branch: str) -> List[FileNode]:
-        """Recursively get directory contents"""
-        contents = repo.get_contents(path, ref=branch)
+    def _build_file_nodes(entries: List[Any]) -> List[FileNode]:
+        """Assemble FileNodes from the flat entries of a recursive git tree
+        
+        Entries are listed parents first, so each one is appended to its
+        directory's children in a single pass. GitHub's entries are already
+        well formed, so nodes are built with model_construct to skip validation.
+        """
         file_nodes: List[FileNode] = []
+        children_by_path: Dict[str, List[FileNode]] = {"": file_nodes}
         
-        for content in contents:
-            if content.type == "dir":
-                file_nodes.append(
-                    FileNode(
-                        id=content.path,
-                        name=content.name,
-                        type=FileNodeType.DIRECTORY,
-                        path=content.path,
-                        children=GitHubService._get_directory_contents(repo, content.path, branch)
-                    )
+        for entry in entries:
+            parent, _, name = entry.path.rpartition("/")
+            siblings = children_by_path.get(parent)
+            if siblings is None:
+                continue
+            
+            if entry.type == "tree":
+                node = FileNode.model_construct(
+                    id=entry.path,
+                    name=name,
+                    type=FileNodeType.DIRECTORY,
+                    path=entry.path,
+                    children=[]
                 )
+                children_by_path[entry.path] = node.children
             else:
-                file_nodes.append(
-                    FileNode(
-                        id=content.path,
-                        name=content.name,
-                        type=FileNodeType.FILE,
-                        path=content.path
-                    )
+                node = FileNode.model_construct(
+                    id=entry.path,
+                    name=name,
+                    type=FileNodeType.FILE,
+                    path=entry.path
                 )
+            siblings.append(node)
+        
+        return file_nodes
+    
+    @staticmethod
+    def _get_directory_contents(repo: Any, path: str, branch: str) -> List[FileNode]:
+        """Get directory contents, fetching each level of subdirectories concurrently"""
+        file_nodes: List[FileNode] = []
+        level = [(path, file_nodes)]
+        
+        with ThreadPoolExecutor(max_workers=DIRECTORY_FETCH_WORKERS) as executor:
+            while level:
+                listings = executor.map(lambda item: repo.get_contents(item[0], ref=branch), level)
+                next_level = []
+                for (_, children), contents in zip(level, listings):
+                    for content in contents:
+                        if content.type == "dir":
+                            node = FileNode.model_construct(
+                                id=content.path,
+                                name=content.name,
+                                type=FileNodeType.DIRECTORY,
+                                path=content.path,
+                                children=[]
+                            )
+                            next_level.append((content.path, node.children))
+                        else:
+                            node = FileNode.model_construct(
+                                id=content.path,
+                                name=content.name,
+                                type=FileNodeType.FILE,
+                                path=content.path
+                            )
+                        children.append(node)
+                level = next_level
         
         return file_nodes
@@ -1,13 +1,25 @@
 """
 Run script for the backend server
 """
+import os
 import uvicorn
+from dotenv import load_dotenv
 
 if __name__ == "__main__":
+    # Server settings are read here, before the app loads .env itself
+    load_dotenv()
+    
+    # Worker processes share the listening socket; reload needs a single process
+    workers = int(os.getenv("WORKERS", "1"))
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8081,
-        reload=True,
+        reload=workers == 1,
+        workers=workers,
+        # "auto" picks uvloop when it is installed
+        loop="auto",
+        # Most frames are small typing/chat messages that don't pay for zlib
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "false").lower() == "true",
         log_level="info",
     )
@@ -0,0 +1,195 @@
+"""
+Tests for the GitHub service
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+import pytest
+from github import BadCredentialsException
+from github.Requester import Requester
+from app.services import github_service
+from app.services.github_service import GitHubService
+
+
+def test_build_file_nodes_nests_entries():
+    """Flat recursive tree entries are nested under their directories"""
+    entries = [
+        SimpleNamespace(path="README.md", type="blob"),
+        SimpleNamespace(path="src", type="tree"),
+        SimpleNamespace(path="src/app", type="tree"),
+        SimpleNamespace(path="src/app/main.py", type="blob"),
+        SimpleNamespace(path="src/util.py", type="blob"),
+    ]
+
+    nodes = GitHubService._build_file_nodes(entries)
+
+    assert [node.path for node in nodes] == ["README.md", "src"]
+    readme, src = nodes
+    assert readme.children is None
+    assert [node.name for node in src.children] == ["app", "util.py"]
+    assert src.children[0].children[0].path == "src/app/main.py"
+    assert src.children[0].children[0].type == "file"
+
+
+def test_get_repo_reuses_recent_handle(monkeypatch):
+    """A repository handle is fetched once per repo and token within the TTL"""
+    lookups = []
+
+    class FakeGithub:
+        def __init__(self, auth, **kwargs):
+            self.token = auth.token
+
+        def get_repo(self, name, lazy=False):
+            lookups.append((name, self.token))
+            return SimpleNamespace(full_name=name)
+
+    monkeypatch.setattr(github_service, "Github", FakeGithub)
+    monkeypatch.setattr(github_service, "_github_clients", OrderedDict())
+    monkeypatch.setattr(github_service, "_repo_handles", OrderedDict())
+
+    first = GitHubService._get_repo("octo/repo", "token")
+    assert GitHubService._get_repo("octo/repo", "token") is first
+    GitHubService._get_repo("octo/repo", "other-token")
+
+    assert lookups == [("octo/repo", "token"), ("octo/repo", "other-token")]
+
+
+def test_get_client_reuses_client_per_token(monkeypatch):
+    """GitHub clients are shared between calls with the same token"""
+    monkeypatch.setattr(github_service, "_github_clients", OrderedDict())
+
+    client = GitHubService._get_client("token")
+    assert GitHubService._get_client("token") is client
+    assert GitHubService._get_client("other-token") is not client
+
+
+def test_get_client_closes_evicted_clients(monkeypatch):
+    """A client pushed out of the cache has its connections closed"""
+    monkeypatch.setattr(github_service, "_github_clients", OrderedDict())
+    monkeypatch.setattr(github_service, "GITHUB_CLIENT_CACHE_SIZE", 1)
+
+    client = GitHubService._get_client("token")
+    closed = []
+    monkeypatch.setattr(client, "close", lambda: closed.append(client))
+
+    GitHubService._get_client("other-token")
+    assert closed == [client]
+
+
+def test_get_directory_contents_walks_subdirectories():
+    """The per-directory fallback nests every level of the tree"""
+    listings = {
+        "": [
+            SimpleNamespace(path="src", name="src", type="dir"),
+            SimpleNamespace(path="README.md", name="README.md", type="file"),
+        ],
+        "src": [
+            SimpleNamespace(path="src/app", name="app", type="dir"),
+        ],
+        "src/app": [
+            SimpleNamespace(path="src/app/main.py", name="main.py", type="file"),
+        ],
+    }
+    repo = SimpleNamespace(get_contents=lambda path, ref: listings[path])
+
+    nodes = GitHubService._get_directory_contents(repo, "", "abc123")
+
+    assert [node.path for node in nodes] == ["src", "README.md"]
+    assert nodes[0].children[0].children[0].path == "src/app/main.py"
+    assert nodes[1].children is None
+
+
+class FakeRequester:
+    """Answers commit lookups with a fixed SHA, or 304 when revalidated"""
+    createException = Requester.createException
+
+    def __init__(self, status=200, output="abc123"):
+        self.status = status
+        self.output = output
+        self.requests = []
+
+    def requestJson(self, verb, url, headers=None):
+        self.requests.append((url, headers))
+        if "If-None-Match" in (headers or {}):
+            return 304, {}, ""
+        return self.status, {"etag": '"v1"'}, self.output
+
+
+def test_get_commit_sha_revalidates_with_etag(monkeypatch):
+    """A repeat ref lookup sends the ETag and reuses the SHA on a 304"""
+    requester = FakeRequester()
+    repo = SimpleNamespace(url="/repos/octo/repo", _requester=requester)
+    monkeypatch.setattr(GitHubService, "_get_repo", staticmethod(lambda name, token: repo))
+    monkeypatch.setattr(github_service, "_resolved_refs", OrderedDict())
+
+    assert GitHubService._get_commit_sha("octo/repo", "feature/x", "token") == "abc123"
+    assert GitHubService._get_commit_sha("octo/repo", "feature/x", "token") == "abc123"
+    sha_only = {"Accept": "application/vnd.github.sha"}
+    assert requester.requests == [
+        ("/repos/octo/repo/commits/feature/x", sha_only),
+        ("/repos/octo/repo/commits/feature/x", {**sha_only, "If-None-Match": '"v1"'}),
+    ]
+
+
+def test_tags_and_shas_resolve_to_a_tree(monkeypatch):
+    """Refs that aren't branch names still yield a file tree"""
+    sha = "4f9a2c0d1e2b3a4c5d6e7f8091a2b3c4d5e6f708"
+    requester = FakeRequester(output=sha)
+    trees = []
+
+    def get_git_tree(ref, recursive):
+        trees.append(ref)
+        return SimpleNamespace(raw_data={}, tree=[SimpleNamespace(path="README.md", type="blob")])
+
+    repo = SimpleNamespace(url="/repos/octo/repo", _requester=requester, get_git_tree=get_git_tree)
+    monkeypatch.setattr(GitHubService, "_get_repo", staticmethod(lambda name, token: repo))
+    monkeypatch.setattr(github_service, "_resolved_refs", OrderedDict())
+
+    for ref in ("v1.0.0", sha):
+        resolved = GitHubService._get_commit_sha("octo/repo", ref, "token")
+        nodes = GitHubService._fetch_file_tree("octo/repo", resolved, "token")
+        assert [node.path for node in nodes] == ["README.md"]
+
+    assert [url for url, _ in requester.requests] == [
+        "/repos/octo/repo/commits/v1.0.0",
+        f"/repos/octo/repo/commits/{sha}",
+    ]
+    assert trees == [sha, sha]
+
+
+def test_rejected_token_is_evicted(monkeypatch):
+    """A token GitHub rejects doesn't keep its cached client"""
+    requester = FakeRequester(status=401, output='{"message": "Bad credentials"}')
+    repo = SimpleNamespace(url="/repos/octo/repo", _requester=requester)
+    monkeypatch.setattr(github_service, "_github_clients", OrderedDict())
+    monkeypatch.setattr(github_service, "_repo_handles", OrderedDict({("octo/repo", github_service.token_digest("token")): (0.0, repo)}))
+    monkeypatch.setattr(github_service, "_resolved_refs", OrderedDict())
+    monkeypatch.setattr(GitHubService, "_get_repo", staticmethod(lambda name, token: repo))
+
+    # Another ref resolved recently with the same token
+    github_service._resolved_refs[("octo/repo", "dev", github_service.token_digest("token"))] = (
+        time.monotonic(), '"v1"', "abc123"
+    )
+
+    client = GitHubService._get_client("token")
+    with pytest.raises(BadCredentialsException):
+        GitHubService._get_commit_sha("octo/repo", "main", "token")
+
+    assert not github_service._repo_handles
+    assert not github_service._resolved_refs
+    assert GitHubService._get_client("token") is not client
+
+
+def test_get_commit_sha_reuses_recent_resolution(monkeypatch):
+    """A ref resolved moments ago by the same token isn't asked for again"""
+    requester = FakeRequester()
+    repo = SimpleNamespace(url="/repos/octo/repo", _requester=requester)
+    monkeypatch.setattr(GitHubService, "_get_repo", staticmethod(lambda name, token: repo))
+    monkeypatch.setattr(github_service, "_resolved_refs", OrderedDict())
+
+    async def resolve_twice():
+        return [await GitHubService.get_commit_sha("octo/repo", "main", "token") for _ in range(2)]
+
+    assert asyncio.run(resolve_twice()) == ["abc123", "abc123"]
+    assert len(requester.requests) == 1
@@ -0,0 +1,269 @@
+"""
+Tests for the WebSocket endpoint
+"""
+import asyncio
+import sys
+from collections import OrderedDict
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core import ws_manager
+from app.core.ws_manager import MAX_PENDING_FRAMES, Connection, manager
+from app.schemas.ws_schemas import FileNode, FileNodeType
+from app.services.github_service import GitHubService
+
+client = TestClient(app)
+
+
+def _receive_batch(websocket):
+    """Receive frames until the next batched (list) frame arrives
+
+    The typing indicator may be flushed on its own ahead of the batch.
+    """
+    frame = websocket.receive_json()
+    while isinstance(frame, dict):
+        frame = websocket.receive_json()
+    return frame
+
+
+def test_submit_config():
+    """Submitting a configuration is acknowledged"""
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "SUBMIT_CONFIG", "payload": {"geminiToken": ""}})
+        assert websocket.receive_json() == {"type": "CONFIG_SUCCESS"}
+
+
+def test_chat_message_batches_response(monkeypatch):
+    """The typing-off indicator and agent response share one frame"""
+    async def process_message(message, context):
+        await asyncio.sleep(0.01)
+        return "pong"
+
+    monkeypatch.setattr(manager.ai_service, "process_message", process_message)
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": "ping"}})
+        assert websocket.receive_json() == {"type": "AGENT_TYPING", "payload": {"isTyping": True}}
+
+        typing_off, response = websocket.receive_json()
+        assert typing_off == {"type": "AGENT_TYPING", "payload": {"isTyping": False}}
+        assert response["type"] == "NEW_CHAT_MESSAGE"
+        assert response["payload"]["sender"] == "agent"
+        assert response["payload"]["text"] == "pong"
+
+
+def test_chat_uses_submitted_config(monkeypatch):
+    """The AI service receives the configuration submitted on the connection"""
+    contexts = []
+
+    async def process_message(message, context):
+        contexts.append(context)
+        return "ok"
+
+    monkeypatch.setattr(manager.ai_service, "process_message", process_message)
+
+    config = {"geminiToken": "", "repo": "octo/repo"}
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "SUBMIT_CONFIG", "payload": config})
+        assert websocket.receive_json() == {"type": "CONFIG_SUCCESS"}
+        websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": "hi"}})
+        frame = _receive_batch(websocket)
+        assert frame[-1]["type"] == "NEW_CHAT_MESSAGE"
+
+    assert contexts == [config]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="eager tasks need Python 3.12+")
+def test_chat_runs_under_eager_task_factory(monkeypatch):
+    """With the lifespan running, chat is answered on eagerly started tasks"""
+    factories = []
+
+    async def process_message(message, context):
+        factories.append(asyncio.get_running_loop().get_task_factory())
+        await asyncio.sleep(0.01)
+        return "eager"
+
+    monkeypatch.setattr(manager.ai_service, "process_message", process_message)
+
+    with TestClient(app) as lifespan_client:
+        with lifespan_client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": "ping"}})
+            frame = _receive_batch(websocket)
+            assert frame[-1]["payload"]["text"] == "eager"
+
+    assert factories == [asyncio.eager_task_factory]
+
+
+def test_chat_burst_is_answered_once(monkeypatch):
+    """Messages arriving together are merged into one AI prompt"""
+    prompts = []
+
+    async def process_message(message, context):
+        prompts.append(message)
+        return "ok"
+
+    monkeypatch.setattr(manager.ai_service, "process_message", process_message)
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": "first"}})
+        websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": "second"}})
+        frame = _receive_batch(websocket)
+        assert frame[-1]["type"] == "NEW_CHAT_MESSAGE"
+
+    assert prompts == ["first\nsecond"]
+
+
+def test_chat_rejects_non_string_text(monkeypatch):
+    """A malformed chat payload is reported and later messages are still answered"""
+    async def process_message(message, context):
+        return "still here"
+
+    monkeypatch.setattr(manager.ai_service, "process_message", process_message)
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": 123}})
+        error, typing_off = _receive_batch(websocket)
+        assert error["payload"]["sender"] == "system"
+        assert typing_off == {"type": "AGENT_TYPING", "payload": {"isTyping": False}}
+
+        websocket.send_json({"type": "SEND_CHAT_MESSAGE", "payload": {"text": "hello"}})
+        frame = _receive_batch(websocket)
+        assert frame[-1]["payload"]["text"] == "still here"
+
+
+def test_identical_prompts_share_one_call(monkeypatch):
+    """Identical prompts in flight at the same time share a single AI call"""
+    prompts = []
+
+    async def process_message(message, context):
+        prompts.append(message)
+        await asyncio.sleep(0.01)
+        return "shared"
+
+    monkeypatch.setattr(manager.ai_service, "process_message", process_message)
+
+    async def ask_twice():
+        return await asyncio.gather(
+            manager._generate_response("hello", {"repo": "octo/repo"}),
+            manager._generate_response("hello", {"repo": "octo/repo"}),
+        )
+
+    assert asyncio.run(ask_twice()) == ["shared", "shared"]
+    assert prompts == ["hello"]
+
+
+def test_fetch_files_reuses_cached_tree(monkeypatch):
+    """An unchanged branch head is served without refetching the tree"""
+    fetches = []
+
+    async def get_commit_sha(repo, ref, token):
+        return "abc123"
+
+    async def fetch_file_tree(repo, ref, token):
+        fetches.append(ref)
+        return [FileNode(id="README.md", name="README.md", type=FileNodeType.FILE, path="README.md")]
+
+    monkeypatch.setattr(GitHubService, "get_commit_sha", get_commit_sha)
+    monkeypatch.setattr(GitHubService, "fetch_file_tree", fetch_file_tree)
+    monkeypatch.setattr(manager, "_tree_cache", OrderedDict())
+    monkeypatch.setattr(manager, "_tree_cache_bytes", 0)
+
+    payload = {"repo": "octo/repo", "branch": "main", "githubToken": "token"}
+    with client.websocket_connect("/ws") as websocket:
+        for _ in range(2):
+            websocket.send_json({"type": "FETCH_FILES", "payload": payload})
+            frame = _receive_batch(websocket)
+            tree_data = frame[-2]
+            assert tree_data["type"] == "FILE_TREE_DATA"
+            assert tree_data["payload"]["tree"][0]["path"] == "README.md"
+
+    assert fetches == ["abc123"]
+
+
+def test_fetch_files_reports_github_errors(monkeypatch):
+    """A failed GitHub lookup is reported as a FILE_TREE_ERROR"""
+    async def get_commit_sha(repo, ref, token):
+        raise RuntimeError('Branch "dev" not found')
+
+    monkeypatch.setattr(GitHubService, "get_commit_sha", get_commit_sha)
+
+    payload = {"repo": "octo/repo", "branch": "dev", "githubToken": "token"}
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "FETCH_FILES", "payload": payload})
+        frame = websocket.receive_json()
+        if isinstance(frame, dict) and frame["type"] == "AGENT_TYPING":
+            frame = websocket.receive_json()
+        if isinstance(frame, list):
+            frame = frame[-1]
+        assert frame == {"type": "FILE_TREE_ERROR", "payload": {"message": 'Branch "dev" not found'}}
+
+
+def test_lagging_client_is_closed():
+    """A client that stops reading is closed instead of buffering forever"""
+    closed = []
+
+    class StalledWebSocket:
+        async def close(self, code):
+            closed.append(code)
+
+    async def flood():
+        conn = Connection(StalledWebSocket())
+        for _ in range(MAX_PENDING_FRAMES + 10):
+            conn.enqueue(b"{}")
+        await conn.writer
+        return conn
+
+    conn = asyncio.run(flood())
+    assert closed == [1013]
+    assert not conn.outbound
+
+
+def test_disconnect_waits_for_lagging_close():
+    """Disconnecting a lagging client lets its close handshake finish"""
+    closed = []
+
+    class SlowClosingWebSocket:
+        async def close(self, code):
+            await asyncio.sleep(0.01)
+            closed.append(code)
+
+    async def flood_and_disconnect():
+        conn = Connection(SlowClosingWebSocket())
+        conn.chat_worker = asyncio.ensure_future(asyncio.sleep(60))
+        manager.active_connections["lagging"] = conn
+        for _ in range(MAX_PENDING_FRAMES + 1):
+            conn.enqueue(b"{}")
+        await manager.disconnect("lagging")
+
+    asyncio.run(flood_and_disconnect())
+    assert closed == [1013]
+
+
+def test_tree_cache_is_bounded_by_size(monkeypatch):
+    """Cached trees are evicted by total size and oversized trees aren't cached"""
+    monkeypatch.setattr(manager, "_tree_cache", OrderedDict())
+    monkeypatch.setattr(manager, "_tree_cache_bytes", 0)
+    monkeypatch.setattr(ws_manager, "TREE_CACHE_BYTES", 10)
+    monkeypatch.setattr(ws_manager, "MAX_CACHED_TREE_BYTES", 6)
+
+    manager._cache_tree(("octo/repo", "a"), b"aaaa")
+    manager._cache_tree(("octo/repo", "b"), b"bbbb")
+    manager._cache_tree(("octo/repo", "c"), b"cccc")
+    manager._cache_tree(("octo/repo", "huge"), b"x" * 7)
+
+    assert list(manager._tree_cache) == [("octo/repo", "b"), ("octo/repo", "c")]
+    assert manager._tree_cache_bytes == 8
+
+
+def test_tree_cache_counts_duplicate_inserts_once(monkeypatch):
+    """Caching the same commit twice replaces the entry instead of double counting"""
+    monkeypatch.setattr(manager, "_tree_cache", OrderedDict())
+    monkeypatch.setattr(manager, "_tree_cache_bytes", 0)
+    monkeypatch.setattr(ws_manager, "TREE_CACHE_BYTES", 10)
+
+    manager._cache_tree(("octo/repo", "a"), b"aaaa")
+    manager._cache_tree(("octo/repo", "a"), b"aaaa")
+    manager._cache_tree(("octo/repo", "b"), b"bbbb")
+
+    assert list(manager._tree_cache) == [("octo/repo", "a"), ("octo/repo", "b")]
+    assert manager._tree_cache_bytes == 8
@@ -37,3 +37,6 @@ export type ServerToClientMessage =
   | { type: 'FILE_TREE_ERROR'; payload: { message: string } }
   | { type: 'NEW_CHAT_MESSAGE'; payload: ChatMessage }
   | { type: 'AGENT_TYPING'; payload: { isTyping: boolean } };
+
+// A single WebSocket frame carries either one message or a batch of messages
+export type ServerToClientFrame = ServerToClientMessage | ServerToClientMessage[];